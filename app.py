@@ -1,122 +1,694 @@
 import os
-import json
+import time
+import math
+import gzip
+import zlib
+import random
+import hmac
+import hashlib
 import uuid
-from datetime import datetime, date
-from functools import wraps
+import threading
+import atexit
+from queue import SimpleQueue, Empty
+from collections import namedtuple, deque
+from types import MappingProxyType
+from functools import lru_cache
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, session, flash, \
+    get_flashed_messages, make_response
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import Markup
+from werkzeug.http import parse_cookie, parse_accept_header
+import orjson
 
-# Google Sheets libs
-import gspread
-from google.oauth2.service_account import Credentials
+from flask_compress import Compress
+
+# Google Sheets libs (gspread, google-auth) are imported on first use so pages
+# that never touch Sheets don't pay for them at startup
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON (session cookie, jsonify) on orjson instead of stdlib json"""
+    def dumps(self, obj, **kwargs):
+        # Dates go through default (http_date) like stdlib json, not orjson's RFC 3339
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__, template_folder="templates")
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("SECRET_KEY", "Passw0rd@123")
+# Templates only change on deploy: never stat them, and drop block whitespace
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
+app.config["COMPRESS_LEVEL"] = 6
+app.config["COMPRESS_MIN_SIZE"] = 500
+# Flask-Compress buffers a whole stream to compress it; leave streams alone
+app.config["COMPRESS_STREAMS"] = False
+Compress(app)
 
 ADMIN_USER = os.environ.get("ADMIN_USER", "admin")
 ADMIN_PASS = os.environ.get("ADMIN_PASS", "password123")
+_SCRYPT = {"n": 2 ** 14, "r": 8, "p": 1}
+
+def hash_admin_password(password, salt=None):
+    """Return "salt:hash" (hex) of a salted scrypt digest, the ADMIN_PASS_SCRYPT format"""
+    salt = salt or os.urandom(16)
+    return f"{salt.hex()}:{hashlib.scrypt(password.encode(), salt=salt, **_SCRYPT).hex()}"
+
+# Set ADMIN_PASS_SCRYPT to keep the plaintext out of the env; generate it with
+# python -c "from app import hash_admin_password; print(hash_admin_password('...'))"
+_ADMIN_USER_HASH = hashlib.sha256(ADMIN_USER.encode()).digest()
+_salt_hex, _hash_hex = (os.environ.get("ADMIN_PASS_SCRYPT") or hash_admin_password(ADMIN_PASS)).split(":")
+_ADMIN_PASS_SALT, _ADMIN_PASS_HASH = bytes.fromhex(_salt_hex), bytes.fromhex(_hash_hex)
 
 SHEET_ID = os.environ.get("SHEET_ID", "").strip()
 GOOGLE_CREDS_JSON = os.environ.get("GOOGLE_CREDS_JSON", "").strip()
 
+def _load_creds_info():
+    if not GOOGLE_CREDS_JSON:
+        return None
+    try:
+        return orjson.loads(GOOGLE_CREDS_JSON)
+    except orjson.JSONDecodeError as e:
+        app.logger.error("GOOGLE_CREDS_JSON is not valid JSON: %s", e)
+        return None
+
+# Parsed once at import; the env var cannot change while the process runs
+_CREDS_INFO = _load_creds_info()
+
 PRICES_SHEET_NAME = "Prices"
 PRICES_HEADERS = ["Material", "Price"]
 
 TRANSACTIONS_SHEET_NAME = "Transactions"
 TRANSACTIONS_HEADERS = ["TransactionID","Date","Employee","Material","Weight","Price","Amount"]
+Transaction = namedtuple("Transaction", TRANSACTIONS_HEADERS)
+_TX_WIDTH = len(TRANSACTIONS_HEADERS)
+_TX_DATE = TRANSACTIONS_HEADERS.index("Date")
+
+# Meta!A2:B2 holds today's date and the Transactions row where today starts;
+# Meta!C2 a token rewritten on every price change
+META_SHEET_NAME = "Meta"
+META_HEADERS = ["Date", "FirstRow", "PricesRev"]
+
+# Pooled HTTPS connections to Sheets, shared by the request threads
+SHEETS_POOL_SIZE = int(os.environ.get("SHEETS_POOL_SIZE", "16"))
+# Quota (429) and unavailable (503) errors mean the request was not applied
+SHEETS_RETRY_STATUSES = (429, 503)
+SHEETS_MAX_RETRIES = int(os.environ.get("SHEETS_MAX_RETRIES", "5"))
+# Longer Retry-After hints are ignored in favour of the normal backoff, so a
+# request thread never sleeps for a minute on one call
+SHEETS_RETRY_AFTER_CAP = float(os.environ.get("SHEETS_RETRY_AFTER_CAP", "5"))
+_GS_CLIENT = None
+_SPREADSHEET = None
+_GS_CLIENT_LOCK = threading.Lock()
+_NO_RETRY = threading.local()
+_WS_CACHE = {}
+
+# In-process caches; admins change prices rarely, dashboards reload often
+# Writes through the app bump Meta!C2; edits made directly in the sheet only
+# show up once PRICES_TTL runs out
+PRICES_TTL = int(os.environ.get("PRICES_TTL", "60"))
+PRICES_REV_CHECK = int(os.environ.get("PRICES_REV_CHECK", "15"))
+TODAY_TX_TTL = int(os.environ.get("TODAY_TX_TTL", "30"))
+ALL_TX_TTL = int(os.environ.get("ALL_TX_TTL", "30"))
+_PRICES_CACHE = {"value": None, "expires": 0.0}
+_PRICES_REV = {"rev": None, "checked": 0.0}
+_TODAY_TX_CACHE = {"value": None, "expires": 0.0}
+_ALL_TX_CACHE = {"value": None, "expires": 0.0}
+_ALL_TX_ETAG = {"values": None, "etag": None}
+_DAY_START = {"date": None, "row": None}
+_TS_CACHE = (0, "")
+_CACHE_LOCK = threading.Lock()
+_DAY_START_LOCK = threading.Lock()
+
+# Optional cache shared by all workers; without REDIS_URL each worker loads prices itself
+REDIS_URL = os.environ.get("REDIS_URL", "")
+PRICES_REDIS_KEY = "ossies_prices"
+_REDIS = None
+# Name of an RQ queue to hand transaction writes to; needs REDIS_URL and a
+# worker process running `rq worker <name> --url $REDIS_URL`. "local" uses a
+# writer thread in each web worker instead
+SHEETS_QUEUE = os.environ.get("SHEETS_QUEUE", "")
+SHEETS_WRITE_BATCH = int(os.environ.get("SHEETS_WRITE_BATCH", "32"))
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
 
 # ---------- Sheets helpers ----------
+_RETRYING_CLIENT = None
+
+def _retrying_client_class():
+    """gspread.Client subclass that backs off on quota/unavailable errors and parses with orjson"""
+    global _RETRYING_CLIENT
+    if _RETRYING_CLIENT is None:
+        import gspread
+
+        class RetryingClient(gspread.Client):
+            def request(self, *args, **kwargs):
+                retries = 0 if getattr(_NO_RETRY, "active", False) else SHEETS_MAX_RETRIES
+                for attempt in range(retries + 1):
+                    try:
+                        resp = super().request(*args, **kwargs)
+                        # gspread decodes every body with resp.json(); do it with orjson
+                        resp.json = lambda **_: orjson.loads(resp.content)
+                        return resp
+                    except gspread.exceptions.APIError as e:
+                        status = e.response.status_code
+                        if status not in SHEETS_RETRY_STATUSES or attempt == retries:
+                            raise
+                        retry_after = e.response.headers.get("Retry-After", "")
+                        if retry_after.isdigit() and int(retry_after) <= SHEETS_RETRY_AFTER_CAP:
+                            wait = int(retry_after)
+                        else:
+                            wait = min(2 ** attempt, 30) + random.random()
+                        app.logger.warning("Sheets API %s, retrying in %.1fs", status, wait)
+                        time.sleep(wait)
+
+        _RETRYING_CLIENT = RetryingClient
+    return _RETRYING_CLIENT
+
 def sheets_enabled():
-    return bool(SHEET_ID and GOOGLE_CREDS_JSON)
+    return bool(SHEET_ID and _CREDS_INFO)
 
 def get_gspread_client():
+    """Authorize once per process; gspread refreshes the token as needed"""
+    global _GS_CLIENT
     if not sheets_enabled():
         raise RuntimeError("Google Sheets not configured")
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds_info = json.loads(GOOGLE_CREDS_JSON)
-    creds = Credentials.from_service_account_info(creds_info, scopes=scopes)
-    return gspread.authorize(creds)
+    with _GS_CLIENT_LOCK:
+        if _GS_CLIENT is None:
+            from google.oauth2.service_account import Credentials
+            from google.auth.transport.requests import AuthorizedSession
+            from requests.adapters import HTTPAdapter
+            scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+            creds = Credentials.from_service_account_info(_CREDS_INFO, scopes=scopes)
+            http = AuthorizedSession(creds)
+            http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=SHEETS_POOL_SIZE))
+            _GS_CLIENT = _retrying_client_class()(auth=creds, session=http)
+        return _GS_CLIENT
 
-def ensure_worksheet(sheet_name, headers):
+def get_spreadsheet():
+    """The opened spreadsheet; open_by_key fetches metadata, so do it once"""
+    global _SPREADSHEET
     client = get_gspread_client()
-    sh = client.open_by_key(SHEET_ID)
+    with _GS_CLIENT_LOCK:
+        if _SPREADSHEET is None:
+            _SPREADSHEET = client.open_by_key(SHEET_ID)
+        return _SPREADSHEET
+
+def ensure_worksheet(sheet_name, headers):
+    """Look the worksheet up (creating it if missing) once per process"""
+    ws = _WS_CACHE.get(sheet_name)
+    if ws is not None:
+        return ws
+    from gspread import WorksheetNotFound
+    sh = get_spreadsheet()
     try:
         ws = sh.worksheet(sheet_name)
-    except gspread.WorksheetNotFound:
+    except WorksheetNotFound:
         ws = sh.add_worksheet(title=sheet_name, rows=1000, cols=len(headers)+3)
         ws.append_row(headers)
+    _WS_CACHE[sheet_name] = ws
     return ws
 
-def get_materials():
+def _cache_get(cache):
+    with _CACHE_LOCK:
+        if cache["value"] is not None and time.monotonic() < cache["expires"]:
+            return cache["value"]
+    return None
+
+def _cache_set(cache, value, ttl):
+    with _CACHE_LOCK:
+        cache["value"] = value
+        cache["expires"] = time.monotonic() + ttl
+
+def _cache_clear(cache):
+    with _CACHE_LOCK:
+        cache["expires"] = 0.0
+
+def get_redis():
+    """Shared Redis client, or None when REDIS_URL isn't set"""
+    global _REDIS
+    if REDIS_URL and _REDIS is None:
+        import redis
+        _REDIS = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+    return _REDIS
+
+# With Redis available, sessions (receipts included) live there and the
+# cookie only carries the random session id
+if REDIS_URL:
+    from flask_session import Session
+    app.config.update(SESSION_TYPE="redis", SESSION_REDIS=get_redis(), SESSION_PERMANENT=False,
+                      SESSION_KEY_PREFIX="ossies_session:")
+    Session(app)
+    # Compiled templates are shared too. Entries are keyed by template name and
+    # checked against the source checksum on load, so a changed template is
+    # recompiled; during a rolling deploy old and new workers overwrite each other
+    from jinja2 import MemcachedBytecodeCache
+    app.jinja_env.bytecode_cache = MemcachedBytecodeCache(get_redis(), prefix="ossies_jinja:")
+
+def _shared_prices_get():
+    r = get_redis()
+    if r is None:
+        return None
     try:
-        ws = ensure_worksheet(PRICES_SHEET_NAME, PRICES_HEADERS)
-        records = ws.get_all_records()
-        return {r["Material"]: float(r.get("Price",0)) for r in records}
+        raw = r.get(PRICES_REDIS_KEY)
+        return orjson.loads(raw) if raw else None
+    except Exception as e:
+        app.logger.warning("redis get error: %s", e)
+        return None
+
+def _shared_prices_set(values, rev):
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(PRICES_REDIS_KEY, PRICES_TTL, orjson.dumps({"rev": rev, "values": values}))
+    except Exception as e:
+        app.logger.warning("redis set error: %s", e)
+
+def invalidate_prices_cache():
+    _cache_clear(_PRICES_CACHE)
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(PRICES_REDIS_KEY)
+        except Exception as e:
+            app.logger.warning("redis delete error: %s", e)
+
+def batch_get_values(ranges):
+    """Read several A1 ranges, from any tabs, in one values.batchGet (cell values only)"""
+    resp = get_spreadsheet().values_batch_get(ranges, params={"fields": "valueRanges.values"})
+    return [vr.get("values", []) for vr in resp.get("valueRanges", [])]
+
+def _parse_prices_rev(values):
+    return values[0][0] if values and values[0] else ""
+
+def _store_prices(values, rev):
+    """Parse Prices!A2:B rows and fill the prices cache"""
+    materials = {}
+    for row in values:
+        if not row or not row[0]:
+            continue
+        price = row[1] if len(row) > 1 else ""
+        materials[row[0]] = float(price) if price != "" else 0.0
+    with _CACHE_LOCK:
+        _PRICES_REV.update(rev=rev, checked=time.monotonic())
+    # Read-only view: every request shares this one dict until the next reload
+    prices = (MappingProxyType(materials), tuple(materials.items()))
+    _cache_set(_PRICES_CACHE, prices, PRICES_TTL)
+    return prices
+
+_NO_PRICES = (MappingProxyType({}), ())
+
+def read_prices_rev(default):
+    """Read Meta!C2 without retrying; on errors log and return default"""
+    _NO_RETRY.active = True
+    try:
+        meta = ensure_worksheet(META_SHEET_NAME, META_HEADERS)
+        return _parse_prices_rev(meta.get_values("C2"))
+    except Exception as e:
+        app.logger.warning("prices revision check failed: %s", e)
+        return default
+    finally:
+        _NO_RETRY.active = False
+
+def get_prices():
+    """Return (materials dict, (material, price) pairs in sheet order).
+
+    Within PRICES_TTL the cached copy is reused as long as Meta!C2 still
+    holds the revision it was loaded with; that one cell is re-read at
+    most every PRICES_REV_CHECK seconds. With REDIS_URL set, a reload
+    first tries the copy cached in Redis by other workers, if its
+    revision matches Meta!C2.
+    """
+    cached = _cache_get(_PRICES_CACHE)
+    if cached is not None and time.monotonic() < _PRICES_REV["checked"] + PRICES_REV_CHECK:
+        return cached
+    if cached is not None:
+        # On quota errors serve the cached copy at once and wait a full
+        # PRICES_REV_CHECK before asking again
+        rev = read_prices_rev(default=_PRICES_REV["rev"])
+        if rev == _PRICES_REV["rev"]:
+            _PRICES_REV["checked"] = time.monotonic()
+            return cached
+    try:
+        # Another worker may already have loaded this revision; a cold worker
+        # checks Meta!C2 first, since that copy can outlive a bump from a worker
+        # without Redis or a hand edit of the sheet
+        shared = _shared_prices_get()
+        if shared is not None:
+            if cached is None:
+                rev = read_prices_rev(default=shared["rev"])
+            if rev == shared["rev"]:
+                return _store_prices(shared["values"], shared["rev"])
+        values, rev = batch_get_values([f"{PRICES_SHEET_NAME}!A2:B", f"{META_SHEET_NAME}!C2"])
+        rev = _parse_prices_rev(rev)
+        _shared_prices_set(values, rev)
+        return _store_prices(values, rev)
     except Exception as e:
         app.logger.error("get_materials error: %s", e)
-        return {}
+        if cached is not None:
+            _PRICES_REV["checked"] = time.monotonic()
+        return cached or _NO_PRICES
 
-def save_prices(prices_dict):
+def get_materials():
+    return get_prices()[0]
+
+def bump_prices_rev():
+    """Tell other workers' caches that the Prices sheet changed"""
+    ws = ensure_worksheet(META_SHEET_NAME, META_HEADERS)
+    ws.update("C2", [[uuid.uuid4().hex[:8]]])
+
+def update_prices(new_prices):
+    """Overwrite only the Price cells of materials already in the sheet"""
+    if not new_prices:
+        return True, None
     try:
         ws = ensure_worksheet(PRICES_SHEET_NAME, PRICES_HEADERS)
-        ws.clear()
-        ws.append_row(PRICES_HEADERS)
-        for mat, price in prices_dict.items():
-            ws.append_row([mat, float(price)])
+        # Rows move when admins edit the sheet by hand, so locate them now
+        price_rows = {row[0]: i for i, row in enumerate(ws.get_values("A2:A"), start=2) if row and row[0]}
+        missing = [mat for mat in new_prices if mat not in price_rows]
+        data = [{"range": f"B{price_rows[mat]}", "values": [[float(price)]]}
+                for mat, price in new_prices.items() if mat in price_rows]
+        if data:
+            ws.batch_update(data)
+            bump_prices_rev()
+        if missing:
+            return False, f"no longer in the Prices sheet: {', '.join(missing)}"
         return True, None
     except Exception as e:
-        app.logger.exception("save_prices error")
+        app.logger.exception("update_prices error")
         return False, str(e)
+    finally:
+        invalidate_prices_cache()
+
+def now_ts():
+    """Local "%Y-%m-%d %H:%M:%S" timestamp, formatted at most once a second"""
+    global _TS_CACHE
+    sec = int(time.time())
+    if _TS_CACHE[0] != sec:
+        _TS_CACHE = (sec, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec)))
+    return _TS_CACHE[1]
+
+def _parse_day_start(values):
+    if values and len(values[0]) > 1 and values[0][1].isdigit():
+        return values[0][0], int(values[0][1])
+    return None, None
 
-def append_transactions(employee_name, weight_dict):
-    """Append only items with weight>0, generate TransactionID"""
+def read_day_start():
+    """Return (date, first_row) from the Meta sheet, or (None, None)"""
+    ws = ensure_worksheet(META_SHEET_NAME, META_HEADERS)
+    return _parse_day_start(ws.get_values("A2:B2"))
+
+def record_day_start(today, first_row):
+    """Point Meta at the first Transactions row written today; only ever lower it"""
+    with _DAY_START_LOCK:
+        if _DAY_START["date"] == today and _DAY_START["row"] <= first_row:
+            return
+        day, row = read_day_start()
+        if day == today and row <= first_row:
+            first_row = row
+        else:
+            ws = ensure_worksheet(META_SHEET_NAME, META_HEADERS)
+            ws.update("A2:B2", [[today, first_row]])
+        _DAY_START.update(date=today, row=first_row)
+
+class LocalWriteQueue:
+    """In-process stand-in for an RQ queue: one thread drains it in batches"""
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.pending = SimpleQueue()
+        # Recent rows whose write failed, kept for re-entry by hand
+        self.failed = deque(maxlen=1000)
+        self.thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, func, rows):
+        self.pending.put((func, rows))
+
+    def close(self, timeout=30):
+        """Let the writer finish what is queued before the process exits"""
+        self.pending.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self.pending.get()
+            batch = []
+            while job is not None:
+                batch.append(job)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    job = self.pending.get(timeout=0.2)
+                except Empty:
+                    break
+            self._write(batch)
+            if job is None:
+                return
+
+    def _write(self, batch):
+        # Consecutive jobs for the same function go out as one call. A failed
+        # call is never replayed: quota errors were already retried by the
+        # client, and anything else (a timeout say) may have been applied
+        i = 0
+        while i < len(batch):
+            func, rows = batch[i]
+            rows = list(rows)
+            i += 1
+            while i < len(batch) and batch[i][0] is func:
+                rows.extend(batch[i][1])
+                i += 1
+            try:
+                func(rows)
+            except Exception:
+                self.failed.extend(rows)
+                app.logger.exception("background write failed, not retried; transactions %s, rows: %r",
+                                     sorted({row[0] for row in rows}), rows)
+
+def get_queue():
+    """Queue for Sheets writes, or None when writes happen in the request"""
+    global _QUEUE
+    if SHEETS_QUEUE and _QUEUE is None:
+        with _QUEUE_LOCK:
+            if _QUEUE is None:
+                if SHEETS_QUEUE == "local":
+                    _QUEUE = LocalWriteQueue(SHEETS_WRITE_BATCH)
+                elif get_redis() is not None:
+                    from rq import Queue
+                    _QUEUE = Queue(SHEETS_QUEUE, connection=get_redis())
+    return _QUEUE
+
+def write_transaction_rows(rows):
+    """Append the rows in one call and note where today's rows start"""
+    ws = ensure_worksheet(TRANSACTIONS_SHEET_NAME, TRANSACTIONS_HEADERS)
+    resp = ws.append_rows(rows)
+    _cache_clear(_TODAY_TX_CACHE)
+    _cache_clear(_ALL_TX_CACHE)
     try:
-        ws = ensure_worksheet(TRANSACTIONS_SHEET_NAME, TRANSACTIONS_HEADERS)
-        materials = get_materials()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        transaction_id = str(uuid.uuid4())[:8]  # short unique ID
-        rows = []
-        for mat, weight in weight_dict.items():
-            if weight <= 0:
-                continue
-            price_per_unit = float(materials.get(mat, 0.0))
-            amount = round(price_per_unit * weight, 2)
-            rows.append([transaction_id, now, employee_name, mat, weight, price_per_unit, amount])
-        for r in rows:
-            ws.append_row(r)
+        from gspread.utils import a1_to_rowcol
+        updated = resp["updates"]["updatedRange"].split("!")[-1]
+        first_row = a1_to_rowcol(updated.split(":")[0])[0]
+        # A batch can straddle midnight; Meta tracks the latest day in it
+        today = rows[-1][_TX_DATE][:10]
+        offset = next(i for i, row in enumerate(rows) if row[_TX_DATE][:10] == today)
+        record_day_start(today, first_row + offset)
+    except Exception:
+        app.logger.exception("record_day_start error")
+
+def append_transactions(employee_name, lines):
+    """Append the priced (material, weight, unit_price, amount) lines, generate TransactionID"""
+    if not lines:
+        return None, None
+    try:
+        now = now_ts()
+        transaction_id = uuid.uuid4().hex[:8]  # short unique ID
+        rows = [[transaction_id, now, employee_name, *line] for line in lines]
+        queue = get_queue()
+        if queue is not None:
+            try:
+                queue.enqueue(write_transaction_rows, rows)
+                _cache_clear(_TODAY_TX_CACHE)
+                _cache_clear(_ALL_TX_CACHE)
+                return transaction_id, None
+            except Exception as e:
+                app.logger.warning("enqueue error, writing inline: %s", e)
+        write_transaction_rows(rows)
         return transaction_id, None
     except Exception as e:
         app.logger.exception("append_transactions error")
         return None, str(e)
 
-def get_transactions(all_rows=True):
+def _as_transaction(row):
+    if len(row) != _TX_WIDTH:
+        row = (row + [""] * _TX_WIDTH)[:_TX_WIDTH]
+    return Transaction._make(row)
+
+def get_all_transactions():
+    """Return (lazy iterator of all rows, ETag of those same rows, error)"""
     try:
+        values = _cache_get(_ALL_TX_CACHE)
+        if values is None:
+            ws = ensure_worksheet(TRANSACTIONS_SHEET_NAME, TRANSACTIONS_HEADERS)
+            values = ws.get_values()
+            _cache_set(_ALL_TX_CACHE, values, ALL_TX_TTL)
+        return (_as_transaction(row) for row in values[1:]), transactions_etag(values), None
+    except Exception as e:
+        app.logger.exception("get_transactions error")
+        return iter(()), None, str(e)
+
+def get_transactions(all_rows=True, day_start=None):
+    """All rows come back as a lazy iterator; today's rows as a list.
+
+    day_start is an already-fetched read_day_start() result, if any.
+    """
+    if all_rows:
+        transactions, _, err = get_all_transactions()
+        return transactions, err
+    try:
+        today_prefix = now_ts()[:10]
+        cached = _cache_get(_TODAY_TX_CACHE)
+        if cached is not None and cached[0] == today_prefix:
+            return cached[1], None
         ws = ensure_worksheet(TRANSACTIONS_SHEET_NAME, TRANSACTIONS_HEADERS)
-        records = ws.get_all_records()
-        if not all_rows:
-            today_prefix = date.today().strftime("%Y-%m-%d")
-            records = [r for r in records if str(r.get("Date","")).startswith(today_prefix)]
+        day, start = day_start or read_day_start()
+        if day == today_prefix:
+            # Only download the rows appended since the first sale of the day,
+            # plus the one above: if that is dated today too, Meta is off
+            rows = ws.get_values(f"A{start - 1}:G")
+            if rows and len(rows[0]) > _TX_DATE and rows[0][_TX_DATE].startswith(today_prefix):
+                day = None
+            else:
+                rows = rows[1:]
+        if day != today_prefix:
+            rows = ws.get_values()[1:]
+            first = next((i for i, row in enumerate(rows, start=2)
+                          if len(row) > _TX_DATE and row[_TX_DATE].startswith(today_prefix)), None)
+            if first is not None:
+                try:
+                    record_day_start(today_prefix, first)
+                except Exception:
+                    app.logger.exception("record_day_start error")
+        records = [_as_transaction(row) for row in rows
+                   if len(row) > _TX_DATE and row[_TX_DATE].startswith(today_prefix)]
+        _cache_set(_TODAY_TX_CACHE, (today_prefix, records), TODAY_TX_TTL)
         return records, None
     except Exception as e:
         app.logger.exception("get_transactions error")
         return [], str(e)
 
-# ---------- Decorators ----------
-def admin_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        if not session.get("admin_logged_in"):
-            return redirect(url_for("admin_login"))
-        return f(*args, **kwargs)
-    return wrapper
-
-def employee_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        if not session.get("employee_name"):
-            return redirect(url_for("employee_login"))
-        return f(*args, **kwargs)
-    return wrapper
+def get_dashboard_data():
+    """Return (materials, today's transactions, error) for the dashboard.
+
+    When neither is cached, the Prices read and the Meta lookup that locates
+    today's rows share one batchGet, leaving only the Transactions range.
+    """
+    day_start = None
+    today = _cache_get(_TODAY_TX_CACHE)
+    if _cache_get(_PRICES_CACHE) is None and (today is None or today[0] != now_ts()[:10]):
+        try:
+            prices, meta = batch_get_values([f"{PRICES_SHEET_NAME}!A2:B", f"{META_SHEET_NAME}!A2:C2"])
+            rev = meta[0][2] if meta and len(meta[0]) > 2 else ""
+            _shared_prices_set(prices, rev)
+            _store_prices(prices, rev)
+            day_start = _parse_day_start(meta)
+        except Exception:
+            app.logger.exception("get_dashboard_data error")
+    transactions, err = get_transactions(all_rows=False, day_start=day_start)
+    return get_materials(), transactions, err
+
+if sheets_enabled():
+    try:
+        ensure_worksheet(PRICES_SHEET_NAME, PRICES_HEADERS)
+        ensure_worksheet(TRANSACTIONS_SHEET_NAME, TRANSACTIONS_HEADERS)
+        ensure_worksheet(META_SHEET_NAME, META_HEADERS)
+    except Exception:
+        app.logger.exception("worksheet init error")
+
+# ---------- Access guard ----------
+# (path prefix, session key that must be set, login endpoint); login/logout stay open
+_GUARDED_PREFIXES = (
+    ("/admin/", "admin_logged_in", "admin_login"),
+    ("/employee/", "employee_name", "employee_login"),
+)
+_OPEN_ENDPOINTS = {"admin_login", "admin_logout", "employee_login", "employee_logout"}
+
+@app.before_request
+def require_login():
+    path = request.path
+    for prefix, key, login_endpoint in _GUARDED_PREFIXES:
+        if path.startswith(prefix):
+            if request.endpoint not in _OPEN_ENDPOINTS and not session.get(key):
+                return redirect(url_for(login_endpoint))
+            return None
+    return None
+
+# ---------- HTTP caching ----------
+def _deploy_version():
+    """Digest of the templates and this module, so a deploy invalidates every ETag"""
+    h = hashlib.sha1(os.environ.get("RENDER_GIT_COMMIT", "").encode())
+    folder = os.path.join(app.root_path, app.template_folder)
+    for path in [__file__] + [os.path.join(folder, name) for name in sorted(os.listdir(folder))]:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:8]
+
+DEPLOY_VERSION = _deploy_version()
+
+def prices_etag(material_items, *extra):
+    """ETag for pages that only change when the prices (or extra) do"""
+    key = repr((DEPLOY_VERSION, material_items) + extra).encode()
+    return hashlib.sha1(key).hexdigest()[:16]
+
+def client_has_etag(etag):
+    # Flask-Compress sends compressed bodies as "<etag>:gzip" (or :br)
+    return any(tag.split(":")[0] == etag for tag in request.if_none_match.as_set())
+
+def transactions_etag(values):
+    """ETag of a Transactions values list, hashed once per reload"""
+    with _CACHE_LOCK:
+        if _ALL_TX_ETAG["values"] is values:
+            return _ALL_TX_ETAG["etag"]
+    # Hash outside the lock so other requests' cache lookups don't wait on it
+    etag = hashlib.sha1(DEPLOY_VERSION.encode() + repr(values).encode()).hexdigest()[:16]
+    with _CACHE_LOCK:
+        _ALL_TX_ETAG.update(values=values, etag=etag)
+    return etag
+
+def gzip_stream(chunks):
+    """Gzip a streamed body as it is produced instead of buffering it"""
+    z = zlib.compressobj(app.config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk.encode())
+        if data:
+            yield data
+    yield z.flush()
+
+def render_cached(etag, template, **context):
+    """Render with an ETag, or answer 304 if the browser already has it"""
+    if "_flashes" not in session and client_has_etag(etag):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(render_template(template, **context))
+    resp.set_etag(etag)
+    # Always revalidate so a price change shows up on the next load
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+@lru_cache(maxsize=8)
+def render_material_rows(template, items):
+    """Per-material form rows only change with the prices, so render them once"""
+    return Markup(render_template(template, materials=items))
 
 # ---------- Routes ----------
 @app.route("/")
@@ -132,7 +704,8 @@ def employee_login():
             flash("Enter your name", "danger")
             return redirect(url_for("employee_login"))
         session["employee_name"] = name
-        session.pop("weight_dict", None)
+        session.pop("receipt_lines", None)
+        session.pop("receipt_total", None)
         return redirect(url_for("employee_payout"))
     return render_template("employee_login.html")
 
@@ -143,19 +716,35 @@ def employee_logout():
     return redirect(url_for("employee_login"))
 
 @app.route("/employee/payout", methods=["GET","POST"])
-@employee_required
 def employee_payout():
     employee_name = session.get("employee_name")
-    materials = get_materials()
+    material_items = get_prices()[1]
 
     if request.method=="POST":
-        weight_dict = {}
-        for mat in materials.keys():
-            raw = request.form.get(mat,"").strip()
-            weight = float(raw) if raw else 0.0
-            weight_dict[mat] = weight
-        session["weight_dict"] = weight_dict
-        transaction_id, err = append_transactions(employee_name, weight_dict)
+        # Price every line once; the receipt and the Sheets rows share the result
+        form = request.form
+        lines = []
+        total = 0.0
+        for mat, price in material_items:
+            raw = form.get(mat)
+            if not raw:
+                continue
+            try:
+                weight = float(raw)
+            except ValueError:
+                continue
+            if not math.isfinite(weight) or weight <= 0:
+                continue
+            amount = round(price*weight, 2)
+            lines.append((mat, weight, price, amount))
+            total += amount
+        if not lines:
+            flash("Enter at least one weight", "warning")
+            return redirect(url_for("employee_payout"))
+        # Plain [material, weight, unit_price, amount] rows keep the cookie small
+        session["receipt_lines"] = lines
+        session["receipt_total"] = round(total, 2)
+        transaction_id, err = append_transactions(employee_name, lines)
         if err:
             flash(f"Warning: transaction not saved: {err}", "danger")
         else:
@@ -163,28 +752,29 @@ def employee_payout():
             session["transaction_id"] = transaction_id
         return redirect(url_for("employee_receipt"))
 
-    return render_template("employee_payout.html", employee_name=employee_name, materials=materials)
+    return render_cached(prices_etag(material_items, employee_name), "employee_payout.html",
+                         employee_name=employee_name,
+                         material_rows=render_material_rows("payout_rows.html", material_items))
 
 @app.route("/employee/receipt")
-@employee_required
 def employee_receipt():
     employee_name = session.get("employee_name")
-    weight_dict = session.get("weight_dict", {}) or {}
+    lines = session.get("receipt_lines") or []
     transaction_id = session.get("transaction_id","N/A")
-    materials_prices = get_materials()
-    items = {mat: {"weight":w, "price":round(materials_prices.get(mat,0)*w,2)}
-             for mat,w in weight_dict.items() if w>0}
-    total = round(sum(i["price"] for i in items.values()),2)
-    return render_template("receipt.html", client_name=employee_name, date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                           transaction_id=transaction_id, materials=items, total=total)
+    total = session.get("receipt_total", 0.0)
+    return render_template("receipt.html", client_name=employee_name, date=now_ts(),
+                           transaction_id=transaction_id, lines=lines, total=total)
 
 # ---------- Admin flow ----------
 @app.route("/admin/login", methods=["GET","POST"])
 def admin_login():
     if request.method=="POST":
-        user = request.form.get("username","")
-        pwd = request.form.get("password","")
-        if user==ADMIN_USER and pwd==ADMIN_PASS:
+        user = hashlib.sha256(request.form.get("username","").encode()).digest()
+        pwd = hashlib.scrypt(request.form.get("password","").encode(), salt=_ADMIN_PASS_SALT, **_SCRYPT)
+        # Compare fixed-length digests in constant time; check both fields always
+        user_ok = hmac.compare_digest(user, _ADMIN_USER_HASH)
+        pwd_ok = hmac.compare_digest(pwd, _ADMIN_PASS_HASH)
+        if user_ok and pwd_ok:
             session["admin_logged_in"]=True
             flash("Welcome admin","success")
             return redirect(url_for("admin_dashboard"))
@@ -199,63 +789,111 @@ def admin_logout():
     return redirect(url_for("admin_login"))
 
 @app.route("/admin/dashboard")
-@admin_required
 def admin_dashboard():
     transactions = []
+    materials = {}
     err = None
     if sheets_enabled():
-        transactions, err = get_transactions(all_rows=False)
+        materials, transactions, err = get_dashboard_data()
         if err:
             flash(f"Could not load transactions: {err}","danger")
     else:
         flash("Sheets not configured","warning")
     headers = TRANSACTIONS_HEADERS
-    return render_template("admin_dashboard.html", transactions=transactions, headers=headers)
+    return render_template("admin_dashboard.html", transactions=transactions, headers=headers,
+                           materials=materials)
 
 @app.route("/admin/transactions")
-@admin_required
 def admin_transactions():
     transactions = []
-    err = None
+    etag = err = None
     if sheets_enabled():
-        transactions, err = get_transactions(all_rows=True)
+        transactions, etag, err = get_all_transactions()
         if err:
             flash(f"Could not load transactions: {err}","danger")
     else:
         flash("Sheets not configured","warning")
     headers = TRANSACTIONS_HEADERS
-    return render_template("admin_transactions.html", transactions=transactions, headers=headers)
+    # Flask-Compress leaves streams alone (COMPRESS_STREAMS off), so gzip as it goes
+    gzipped = request.accept_encodings["gzip"] > 0
+    if etag and "_flashes" not in session and client_has_etag(etag):
+        resp = make_response("", 304)
+    else:
+        # Pop the flashes now: the session cookie is sent before the body streams
+        get_flashed_messages(with_categories=True)
+        body = stream_template("admin_transactions.html", transactions=transactions, headers=headers)
+        resp = app.response_class(gzip_stream(body) if gzipped else body)
+        if gzipped:
+            resp.headers["Content-Encoding"] = "gzip"
+    if etag:
+        resp.set_etag(etag + ":gzip" if gzipped else etag)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+    return resp
 
 @app.route("/admin/prices", methods=["GET","POST"])
-@admin_required
 def admin_prices():
-    materials = get_materials()
+    material_items = get_prices()[1]
     if request.method=="POST":
+        form=request.form
         new_prices={}
-        for mat in materials.keys():
-            raw=request.form.get(mat,"").strip()
+        for mat, current in material_items:
+            raw=form.get(mat,"").strip()
             if raw=="":
                 continue
             try:
-                new_prices[mat]=float(raw)
+                price=float(raw)
             except:
                 flash(f"Invalid price for {mat}","danger")
                 return redirect(url_for("admin_prices"))
-        merged=dict(materials)
-        merged.update(new_prices)
-        ok, err = save_prices(merged)
+            if price!=current:
+                new_prices[mat]=price
+        ok, err = update_prices(new_prices)
         if not ok:
             flash(f"Error saving prices: {err}","danger")
         else:
             flash("Prices updated","success")
         return redirect(url_for("admin_prices"))
-    return render_template("admin_prices.html", materials=materials)
+    return render_cached(prices_etag(material_items), "admin_prices.html",
+                         material_rows=render_material_rows("price_rows.html", material_items))
 
 # ---------- Error ----------
 @app.errorhandler(500)
 def server_error(e):
     return render_template("500.html", error=e), 500
 
+# ---------- WSGI fast path ----------
+class FastPathMiddleware:
+    """Answer the liveness probe and the anonymous home page without Flask dispatch"""
+    HEALTH = b'{"status":"ok"}'
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        with app.test_request_context("/"):
+            self.index = render_template("index.html").encode()
+        self.index_gz = gzip.compress(self.index, compresslevel=app.config["COMPRESS_LEVEL"])
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO")
+        if environ.get("REQUEST_METHOD") == "GET":
+            if path == "/_health":
+                start_response("200 OK", [("Content-Type", "application/json"),
+                                          ("Content-Length", str(len(self.HEALTH)))])
+                return [self.HEALTH]
+            # A session cookie may carry flashes, so only cookie-less visitors get the cached page
+            if path == "/" and app.config["SESSION_COOKIE_NAME"] not in parse_cookie(environ):
+                headers = [("Content-Type", "text/html; charset=utf-8"), ("Vary", "Accept-Encoding")]
+                body = self.index
+                if parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING", ""))["gzip"] > 0:
+                    body = self.index_gz
+                    headers.append(("Content-Encoding", "gzip"))
+                headers.append(("Content-Length", str(len(body))))
+                start_response("200 OK", headers)
+                return [body]
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = FastPathMiddleware(app.wsgi_app)
+
 if __name__=="__main__":
     port=int(os.environ.get("PORT",5000))
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,14 @@
+import os
+
+# Requests spend most of their time waiting on sheets.googleapis.com, so
+# run several workers and let each serve many of them at once, on threads
+# by default or on greenlets with GUNICORN_WORKER_CLASS=gevent. Each worker
+# holds its own caches and Sheets client, so keep the count small unless the
+# host sets WEB_CONCURRENCY.
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "200"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "30"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
@@ -0,0 +1,33 @@
+import os
+import unittest
+
+os.environ["SHEET_ID"] = ""
+os.environ["GOOGLE_CREDS_JSON"] = ""
+
+import app
+
+
+class TimeoutAfterWrite:
+    """Worksheet stand-in whose append lands but the response never arrives"""
+    def __init__(self):
+        self.rows = []
+
+    def __call__(self, rows):
+        self.rows.extend(rows)
+        raise TimeoutError("read timed out")
+
+
+class LocalWriteQueueTest(unittest.TestCase):
+    def test_error_after_write_is_applied_is_not_replayed(self):
+        sheet = TimeoutAfterWrite()
+        queue = app.LocalWriteQueue(batch_size=32)
+        queue.enqueue(sheet, [["t1", "2026-10-14 09:00:00"]])
+        queue.enqueue(sheet, [["t2", "2026-10-14 09:00:01"]])
+        queue.close()
+
+        self.assertEqual([row[0] for row in sheet.rows], ["t1", "t2"])
+        self.assertEqual([row[0] for row in queue.failed], ["t1", "t2"])
+
+
+if __name__ == "__main__":
+    unittest.main()